@@ -39,6 +39,8 @@ def get_model(
     model_kwargs: Optional[Dict[str, Any]] = None,
     feature_extractor_kwargs: Optional[Dict[str, Any]] = None,
     pooler_kwargs: Optional[Dict[str, Any]] = None,
+    quantize: bool = False,
+    autocast: bool = False,
 ) -> HaystackModel:
     """
     Load a pretrained language model by specifying its name and either downloading the model from the Hugging Face hub
@@ -59,6 +61,10 @@ def get_model(
     :param pooler_kwargs: A dictionary of parameters to pass to the pooler's initialization (summary_last_dropout, summary_activation, etc...)
         Haystack applies some default parameters to some models. You can override them by specifying the
         desired value in this parameter. See `POOLER_PARAMETERS`.
+    :param quantize: Whether to apply dynamic int8 quantization to the model when it runs on CPU.
+        Only supported by Sentence Transformers models.
+    :param autocast: Whether to run the model in mixed precision when it runs on GPU.
+        Only supported by Sentence Transformers models.
     """
     autoconfig_kwargs = autoconfig_kwargs or {}
     model_kwargs = model_kwargs or {}
@@ -75,7 +81,7 @@ def get_model(
     model_wrapper_class: Type[HaystackModel]
 
     # Prepare the kwargs the model wrapper expects (see each wrapper's init for details)
-    wrapper_kwarg_groups = {}
+    wrapper_kwarg_groups: Dict[str, Any] = {}
     wrapper_kwarg_groups["model_kwargs"] = model_kwargs
 
     # SentenceTransformers are much faster, so use them whenever possible
@@ -83,6 +89,8 @@ def get_model(
         pretrained_model_name_or_path, use_auth_token=autoconfig_kwargs.get("use_auth_token", False)
     ):
         model_wrapper_class = HaystackSentenceTransformerModel
+        wrapper_kwarg_groups["quantize"] = quantize
+        wrapper_kwarg_groups["autocast"] = autocast
         try:
             # Use AutoConfig to log some more info about the model class
             config = AutoConfig.from_pretrained(pretrained_model_name_or_path=model_name, **autoconfig_kwargs)
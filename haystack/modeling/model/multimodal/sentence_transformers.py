@@ -1,6 +1,11 @@
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, List, Union, Tuple
 
+import copy
+import itertools
 import logging
+import math
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import torch
@@ -14,6 +19,36 @@ from haystack.schema import ContentTypes
 logger = logging.getLogger(__name__)
 
 
+#: Models already loaded in this process, keyed by name and model kwargs. Wrappers that load the same model with
+#: the same parameters share its weights instead of reading them from disk again, each wrapper still has its own
+#: modules. Entries are dropped as soon as no wrapper uses them anymore.
+_MODEL_CACHE: "weakref.WeakValueDictionary[Tuple[str, Tuple[Tuple[str, str], ...]], SentenceTransformer]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def _share_weights(model: SentenceTransformer) -> SentenceTransformer:
+    """
+    Copy the modules of the model, sharing its parameters and buffers with the copy instead of copying them.
+    """
+    memo = {id(tensor): tensor for tensor in itertools.chain(model.parameters(), model.buffers())}
+    return copy.deepcopy(model, memo)
+
+
+def _copy_to_device(model: SentenceTransformer, device: torch.device) -> SentenceTransformer:
+    """
+    Copy the model to the given device without modifying it.
+
+    `nn.Module.to()` moves the parameters in place, which would also move them for the other models sharing them.
+    """
+    memo: Dict[int, Any] = {
+        id(parameter): nn.Parameter(parameter.detach().to(device), requires_grad=parameter.requires_grad)
+        for parameter in model.parameters()
+    }
+    memo.update({id(buffer): buffer.to(device) for buffer in model.buffers()})
+    return copy.deepcopy(model, memo)
+
+
 class HaystackSentenceTransformerModel(HaystackModel):
     """
     Parent class for `sentence-transformers` models.
@@ -31,6 +66,8 @@ class HaystackSentenceTransformerModel(HaystackModel):
         model_type: str,
         content_type: ContentTypes,
         model_kwargs: Optional[Dict[str, Any]] = None,
+        quantize: bool = False,
+        autocast: bool = False,
     ):
         """
         :param pretrained_model_name_or_path: The name of the model to load.
@@ -41,14 +78,34 @@ class HaystackSentenceTransformerModel(HaystackModel):
             (revision, use_auth_key, and so on)
             Haystack applies some default parameters to some models. You can override them by specifying the
             desired value in this parameter. See `DEFAULT_MODEL_PARAMS`.
+        :param quantize: Whether to apply dynamic int8 quantization to the linear layers of the model.
+            Only applied when the model runs on CPU.
+        :param autocast: Whether to run the model in mixed precision (bfloat16 if the GPU supports it, float16
+            otherwise). Only applied when the model runs on GPU. The embeddings are returned as float32.
+
+        Instances that load the same model with the same `model_kwargs` share its weights as long as they run it
+        on the same device and don't quantize it. Each instance has its own `SentenceTransformer` object.
         """
         super().__init__(
             pretrained_model_name_or_path=pretrained_model_name_or_path,
             model_type=model_type,
             content_type=content_type,
         )
+        self.quantize = quantize
+        self.autocast = autocast
+        self.devices: Optional[List[torch.device]] = None
+        self.replicas: List[SentenceTransformer] = []
+        self._cache_key = (
+            str(pretrained_model_name_or_path),
+            tuple(sorted((key, repr(value)) for key, value in (model_kwargs or {}).items())),
+        )
         try:
-            self.model = SentenceTransformer(pretrained_model_name_or_path, **(model_kwargs or {}))
+            cached_model = _MODEL_CACHE.get(self._cache_key)
+            if cached_model is None:
+                self.model = SentenceTransformer(pretrained_model_name_or_path, **(model_kwargs or {}))
+                _MODEL_CACHE[self._cache_key] = self.model
+            else:
+                self.model = _share_weights(cached_model)
         except Exception as e:
             logger.exception(
                 "Models of type '%s' like %s "
@@ -75,18 +132,62 @@ class HaystackSentenceTransformerModel(HaystackModel):
     def to(self, devices: Optional[List[torch.device]]) -> None:
         """
         Send the model to the specified PyTorch devices.
+
+        With more than one device, the model is replicated once per device and `encode()` splits each batch
+        across the replicas.
         """
-        if devices:
-            if len(devices) > 1:
-                self.model = nn.DataParallel(self.model, device_ids=devices)
+        self.devices = devices
+        if devices and any(parameter.device != devices[0] for parameter in self.model.parameters()):
+            # The weights might be shared with other instances, so they are copied instead of moved in place
+            self.model = _copy_to_device(self.model, devices[0])
+            # Later instances running on the same device share the moved weights
+            _MODEL_CACHE[self._cache_key] = self.model
+
+        if self.quantize:
+            if devices and any(device.type != "cpu" for device in devices):
+                logger.warning(
+                    "Quantization is only supported on CPU. '%s' won't be quantized.", self.model_name_or_path
+                )
             else:
-                self.model.to(devices[0])
+                # Not in-place: the unquantized weights might be shared with other instances
+                self.model = torch.quantization.quantize_dynamic(self.model, {nn.Linear}, dtype=torch.qint8)
+
+        self.replicas = [_copy_to_device(self.model, device) for device in (devices or [])[1:]]
 
     def encode(self, data: List[Any], **kwargs) -> torch.Tensor:
         """
         Generate the tensors representing the input data.
 
-        Validates the inputs according to what the subclass declared in the `expected_inputs` property.
-        Then passes the vectors to the `_forward()` method and returns its output untouched.
+        If the model was sent to several devices, the data is split in one chunk per device and encoded by each
+        replica in a separate thread. The outputs are gathered on the first device.
+        """
+        if not data:
+            return torch.empty(
+                (0, self.model.get_sentence_embedding_dimension() or 0),
+                device=self.devices[0] if self.devices else None,
+            )
+        if not self.replicas:
+            return self._encode(self.model, data, self.devices[0] if self.devices else None, **kwargs)
+
+        models = [self.model] + self.replicas
+        chunk_size = math.ceil(len(data) / len(models))
+        with ThreadPoolExecutor(max_workers=len(models)) as executor:
+            futures = [
+                executor.submit(self._encode, model, data[start : start + chunk_size], device, **kwargs)
+                for model, device, start in zip(models, self.devices, range(0, len(data), chunk_size))  # type: ignore
+            ]
+            outputs = [future.result() for future in futures]
+        return torch.cat([output.to(self.devices[0]) for output in outputs])  # type: ignore
+
+    def _encode(
+        self, model: SentenceTransformer, data: List[Any], device: Optional[torch.device], **kwargs
+    ) -> torch.Tensor:
+        """
+        Encode the data with the given model on the given device.
         """
-        return self.model.encode(data, convert_to_tensor=True, **kwargs)
+        use_autocast = self.autocast and device is not None and device.type == "cuda"
+        autocast_dtype = torch.bfloat16 if use_autocast and torch.cuda.is_bf16_supported() else torch.float16
+        # Entered here and not in encode(): inference mode and autocast are thread-local
+        with torch.inference_mode(), torch.autocast(device_type="cuda", dtype=autocast_dtype, enabled=use_autocast):
+            output = model.encode(data, convert_to_tensor=True, device=str(device) if device else None, **kwargs)
+        return output.float() if use_autocast else output
@@ -18,28 +18,37 @@ Thanks for the great work!
 """
 
 import logging
-from typing import List, Union, Dict, Optional, Tuple, Any
+from typing import List, Union, Dict, Optional, Tuple, Any, Iterator, Set
 
 try:
     from typing import Literal
 except ImportError:
     from typing_extensions import Literal  # type: ignore
 
+import functools
 import itertools
+import operator
+import tempfile
+from pathlib import Path
+
 import torch
 from torch.utils.data import Dataset, DataLoader
 import numpy as np
 
-from transformers import AutoTokenizer, AutoModelForTokenClassification
+from transformers import AutoConfig, AutoTokenizer, AutoModelForTokenClassification
+from transformers.models.auto.modeling_auto import MODEL_FOR_TOKEN_CLASSIFICATION_MAPPING
 from tokenizers.pre_tokenizers import WhitespaceSplit
 from tqdm.auto import tqdm
 from haystack.schema import Document
 from haystack.nodes.base import BaseComponent
 from haystack.modeling.utils import initialize_device_settings
-from haystack.utils.torch_utils import ensure_tensor_on_device
+from haystack.utils.torch_utils import ensure_tensor_on_device, prefetch_to_device
+from haystack.utils.import_utils import _optional_component_not_installed
 
 logger = logging.getLogger(__name__)
 
+_get_entity_span = operator.itemgetter("start", "end")
+
 
 class EntityExtractor(BaseComponent):
     """
@@ -88,6 +97,8 @@ class EntityExtractor(BaseComponent):
         Explained in more detail here:
         https://huggingface.co/docs/transformers/model_doc/roberta#transformers.RobertaTokenizer
     :param num_workers: Number of workers to be used in the Pytorch Dataloader.
+    :param prefetch_factor: Number of batches loaded in advance by each worker of the Pytorch Dataloader. Only used
+        if `num_workers` is greater than 0.
     :param flatten_entities_in_meta_data: If True this converts all entities predicted for a document from a list of
         dictionaries into a single list for each key in the dictionary.
     :param max_seq_len: Max sequence length of one input text for the model. If not provided the max length is
@@ -97,6 +108,19 @@ class EntityExtractor(BaseComponent):
         do not use word-level tokenizers.
     :param ignore_labels: Optionally specify a list of labels to ignore. If None is specified it
         defaults to `["O"]`.
+    :param use_onnx: If True, export the model to ONNX when the node is initialized and run inference with
+        ONNX Runtime instead of PyTorch. Requires `pip install farm-haystack[onnx]` (or `[onnx-gpu]` for GPU).
+    :param autocast: If True, run the model in mixed precision (bfloat16 if the GPU supports it, float16 otherwise).
+        The model weights are cast to this precision as well, which halves their memory usage. This speeds up
+        inference on recent GPUs, but entity scores are computed with reduced precision.
+        Only used when running on GPU with PyTorch.
+    :param torch_compile: If True, compile the model with `torch.compile` to fuse its operations into fewer kernels.
+        Requires PyTorch 2.0 or later, the first batches of each new shape take longer while the model is compiled.
+        Only used when running with PyTorch.
+    :param quantize: If True, apply dynamic int8 quantization to the linear layers of the model. This speeds up
+        inference on CPU at the cost of slightly less accurate scores. Only used when running on CPU with PyTorch.
+    :param docs_per_chunk: Number of texts that are tokenized and predicted together. Only the model outputs of one
+        chunk of texts are kept in memory at a time, which bounds the peak memory usage on large corpora.
     """
 
     outgoing_edges = 1
@@ -113,10 +137,16 @@ class EntityExtractor(BaseComponent):
         aggregation_strategy: Literal[None, "simple", "first", "average", "max"] = "first",
         add_prefix_space: Optional[bool] = None,
         num_workers: int = 0,
+        prefetch_factor: int = 2,
         flatten_entities_in_meta_data: bool = False,
         max_seq_len: int = None,
         pre_split_text: bool = False,
         ignore_labels: Optional[List[str]] = None,
+        use_onnx: bool = False,
+        autocast: bool = False,
+        torch_compile: bool = False,
+        quantize: bool = False,
+        docs_per_chunk: int = 1000,
     ):
         super().__init__()
 
@@ -131,9 +161,11 @@ class EntityExtractor(BaseComponent):
         self.model_name_or_path = model_name_or_path
         self.use_auth_token = use_auth_token
         self.num_workers = num_workers
+        self.prefetch_factor = prefetch_factor
+        self.docs_per_chunk = docs_per_chunk
         self.flatten_entities_in_meta_data = flatten_entities_in_meta_data
         self.aggregation_strategy = aggregation_strategy
-        self.ignore_labels = ignore_labels
+        self.ignore_labels = ["O"] if ignore_labels is None else ignore_labels
 
         if add_prefix_space is None:
             tokenizer = AutoTokenizer.from_pretrained(model_name_or_path, use_auth_token=use_auth_token)
@@ -152,13 +184,78 @@ class EntityExtractor(BaseComponent):
 
         self.pre_split_text = pre_split_text
         self.pre_tokenizer = WhitespaceSplit()
-
+        # Short fields such as titles or tags often repeat across Documents, so the whitespace split is cached
+        self._pre_tokenize_str = functools.lru_cache(maxsize=4096)(self.pre_tokenizer.pre_tokenize_str)
+
+        config = AutoConfig.from_pretrained(model_name_or_path, use_auth_token=use_auth_token, revision=model_version)
+        model_kwargs = {}
+        # Fused scaled dot product attention doesn't materialize the attention matrix. It is only available in
+        # recent versions of transformers and for some model architectures.
+        model_class = MODEL_FOR_TOKEN_CLASSIFICATION_MAPPING.get(type(config), None)
+        if getattr(model_class, "_supports_sdpa", False):
+            model_kwargs["attn_implementation"] = "sdpa"
         self.model = AutoModelForTokenClassification.from_pretrained(
-            model_name_or_path, use_auth_token=use_auth_token, revision=model_version
+            model_name_or_path, config=config, use_auth_token=use_auth_token, revision=model_version, **model_kwargs
         )
         self.model.to(str(self.devices[0]))
+        self.onnx_session = self._load_onnx_session() if use_onnx else None
+        self.autocast = autocast and self.devices[0].type == "cuda"
+        if autocast and not self.autocast:
+            logger.warning(
+                "Mixed precision inference is only supported on GPU, %s runs in full precision.", self.devices[0]
+            )
+        self.autocast_dtype = torch.bfloat16 if self.autocast and torch.cuda.is_bf16_supported() else torch.float16
+        if self.autocast and self.onnx_session is None:
+            # Storing the weights in reduced precision saves autocast from casting them again in every forward pass
+            self.model.to(self.autocast_dtype)
+        if quantize and self.onnx_session is None:
+            if self.devices[0].type == "cpu":
+                self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            else:
+                logger.warning("Quantization is only supported on CPU, %s runs in full precision.", self.devices[0])
+        if torch_compile and self.onnx_session is None:
+            if hasattr(torch, "compile"):
+                # Sequence lengths vary from batch to batch, dynamic shapes avoid recompiling for each of them
+                self.model = torch.compile(self.model, dynamic=True)
+            else:
+                logger.warning(
+                    "torch.compile is not available in PyTorch %s, the model runs without compilation.",
+                    torch.__version__,
+                )
         self.entity_postprocessor = _EntityPostProcessor(model=self.model, tokenizer=self.tokenizer)
 
+    def _load_onnx_session(self):
+        """Export the token classification model to ONNX and load it in an ONNX Runtime inference session."""
+        try:
+            import onnxruntime
+        except (ImportError, ModuleNotFoundError) as ie:
+            _optional_component_not_installed(__name__, "onnx", ie)
+
+        # Same inputs that TokenClassificationDataset feeds to the model
+        input_names = ["input_ids", "attention_mask"]
+        tokenized = self.tokenizer(["Haystack"], return_tensors="pt")
+        tokenized["attention_mask"] = tokenized["attention_mask"].to(torch.int32)
+        dummy_inputs = ensure_tensor_on_device({name: tokenized[name] for name in input_names}, device=self.devices[0])
+
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ["CUDAExecutionProvider"] if self.devices[0].type == "cuda" else ["CPUExecutionProvider"]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            onnx_path = Path(tmp_dir) / "model.onnx"
+            torch.onnx.export(
+                self.model,
+                (dummy_inputs,),
+                str(onnx_path),
+                input_names=input_names,
+                output_names=["logits"],
+                dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["logits"]},
+                do_constant_folding=True,
+                opset_version=14,
+            )
+            onnx_session = onnxruntime.InferenceSession(str(onnx_path), sess_options, providers=providers)
+        return onnx_session
+
     @staticmethod
     def _add_entities_to_doc(
         doc: Union[Document, dict], entities: List[dict], flatten_entities_in_meta_data: bool = False
@@ -172,21 +269,16 @@ class EntityExtractor(BaseComponent):
         """
         is_doc = isinstance(doc, Document)
         if flatten_entities_in_meta_data:
-            new_key_map = {
-                "entity_group": "entity_groups",
-                "score": "entity_scores",
-                "word": "entity_words",
-                "start": "entity_starts",
-                "end": "entity_ends",
+            entity_lists: Dict[str, List[Any]] = {
+                "entity_groups": [entity["entity_group"] for entity in entities],
+                # Converts the NumPy scores to Python floats in one go
+                "entity_scores": np.fromiter(
+                    (entity["score"] for entity in entities), dtype=np.float64, count=len(entities)
+                ).tolist(),
+                "entity_words": [entity["word"] for entity in entities],
+                "entity_starts": [entity["start"] for entity in entities],
+                "entity_ends": [entity["end"] for entity in entities],
             }
-            entity_lists: Dict[str, List[Any]] = {v: [] for k, v in new_key_map.items()}
-            for entity in entities:
-                for key in entity:
-                    new_key = new_key_map[key]
-                    if isinstance(entity[key], np.float32):
-                        entity_lists[new_key].append(float(entity[key]))
-                    else:
-                        entity_lists[new_key].append(entity[key])
             if is_doc:
                 doc.meta.update(entity_lists)  # type: ignore
             else:
@@ -203,14 +295,16 @@ class EntityExtractor(BaseComponent):
         """
         if documents:
             is_doc = isinstance(documents[0], Document)
-            for doc in tqdm(documents, disable=not self.progress_bar, desc="Extracting entities"):
-                # In a querying pipeline, doc is a haystack.schema.Document object
-                if is_doc:
-                    content = doc.content  # type: ignore
-                # In an indexing pipeline, doc is a dictionary
-                else:
-                    content = doc["content"]  # type: ignore
-                entities = self.extract(content)
+            # In a querying pipeline, doc is a haystack.schema.Document object
+            if is_doc:
+                contents = [doc.content for doc in documents]  # type: ignore
+            # In an indexing pipeline, doc is a dictionary
+            else:
+                contents = [doc["content"] for doc in documents]  # type: ignore
+
+            all_entities = self.extract(contents, batch_size=self.batch_size)
+
+            for entities, doc in zip(all_entities, documents):
                 self._add_entities_to_doc(
                     doc, entities=entities, flatten_entities_in_meta_data=self.flatten_entities_in_meta_data
                 )
@@ -250,16 +344,15 @@ class EntityExtractor(BaseComponent):
         """
         text_to_tokenize = sentence
         if self.pre_split_text:
-            word_offset_mapping = [self.pre_tokenizer.pre_tokenize_str(t) for t in sentence]
+            word_offset_mapping = [self._pre_tokenize_str(t) for t in sentence]
             text_to_tokenize = [[word_with_pos[0] for word_with_pos in text] for text in word_offset_mapping]  # type: ignore
 
+        # No padding here: each batch is padded to its longest split by `TokenClassificationDataset.collate_fn`
         model_inputs = self.tokenizer(
             text_to_tokenize,
-            return_tensors="pt",
             return_special_tokens_mask=True,
             return_offsets_mapping=True,
             return_overflowing_tokens=True,
-            padding="max_length",
             truncation=True,
             max_length=self.max_seq_len,
             is_split_into_words=self.pre_split_text,
@@ -269,7 +362,7 @@ class EntityExtractor(BaseComponent):
         if self.pre_split_text:
             model_inputs["word_offset_mapping"] = word_offset_mapping
 
-        word_ids = [model_inputs.word_ids(i) for i in range(model_inputs.input_ids.shape[0])]
+        word_ids = [model_inputs.word_ids(i) for i in range(len(model_inputs["input_ids"]))]
         model_inputs["word_ids"] = word_ids
         return model_inputs
 
@@ -280,12 +373,23 @@ class EntityExtractor(BaseComponent):
         """
         special_tokens_mask = model_inputs.pop("special_tokens_mask")
         offset_mapping = model_inputs.pop("offset_mapping", None)
-        overflow_to_sample_mapping = model_inputs.pop("overflow_to_sample_mapping")
+        overflow_to_sample_mapping = model_inputs.pop("overflow_to_sample_mapping", None)
 
-        logits = self.model(**model_inputs)[0]
+        if self.onnx_session is not None:
+            onnx_inputs = {
+                model_input.name: model_inputs[model_input.name].cpu().numpy()
+                for model_input in self.onnx_session.get_inputs()
+            }
+            logits = torch.from_numpy(self.onnx_session.run(None, onnx_inputs)[0])
+        else:
+            with torch.autocast(device_type="cuda", dtype=self.autocast_dtype, enabled=self.autocast):
+                logits = self.model(**model_inputs)[0]
+        # Softmax runs on the model's device, in full precision since postprocessing uses NumPy (no bfloat16 support).
+        # Passing the dtype upcasts inside the softmax kernel instead of materializing a float32 copy of the logits.
+        scores = torch.softmax(logits, dim=-1, dtype=torch.float32)
 
         return {
-            "logits": logits,
+            "scores": scores,
             "special_tokens_mask": special_tokens_mask,
             "offset_mapping": offset_mapping,
             "overflow_to_sample_mapping": overflow_to_sample_mapping,
@@ -297,16 +401,30 @@ class EntityExtractor(BaseComponent):
 
         :param model_outputs_grouped_by_doc: model outputs grouped by Document
         """
-        results_per_doc = []
-        num_docs = len(model_outputs_grouped_by_doc)
-        for i in range(num_docs):
-            results = self.entity_postprocessor.postprocess(
-                model_outputs=model_outputs_grouped_by_doc[i],
-                aggregation_strategy=self.aggregation_strategy,
-                ignore_labels=self.ignore_labels,
-            )
-            results_per_doc.append(results)
-        return results_per_doc
+        # The postprocessing parameters are the same for all documents, bind them once
+        postprocess_doc = functools.partial(
+            self.entity_postprocessor.postprocess,
+            aggregation_strategy=self.aggregation_strategy,
+            ignore_labels=self.ignore_labels,
+        )
+        return [
+            postprocess_doc(model_outputs=model_outputs) if model_outputs.get("has_entities", True) else []
+            for model_outputs in model_outputs_grouped_by_doc
+        ]
+
+    def _get_ignored_labels(self) -> Optional[torch.Tensor]:
+        """Get a mask of the labels that can never produce an entity given `ignore_labels`.
+
+        Documents where all tokens are predicted with one of these labels are not postprocessed, they have no entities.
+        Returns None if this can't be decided from the label predicted for each token.
+        """
+        id2label = self.model.config.id2label
+        ignored_labels = torch.tensor([id2label[i].split("-")[-1] in self.ignore_labels for i in range(len(id2label))])
+        # Averaging the scores of the tokens of a word can select a label that isn't predicted for any of its tokens,
+        # this label is only guaranteed to be ignored if a single label is ignored
+        if not ignored_labels.any() or (self.aggregation_strategy == "average" and ignored_labels.sum() > 1):
+            return None
+        return ignored_labels
 
     def _group_predictions_by_doc(
         self,
@@ -317,10 +435,11 @@ class EntityExtractor(BaseComponent):
     ) -> List[Dict[str, Any]]:
         """Aggregate each of the items in `model_outputs` based on which Document they originally came from.
 
-        :param model_outputs: Dictionary of model outputs.
+        :param model_outputs: Dictionary of model outputs where the tokens of all splits are concatenated, see
+            `extract`.
         :param sentence: num_docs x length of text
         :param word_ids: List of list of integers or None types that provides the token index to word id mapping.
-            None types correspond to special tokens. The shape is (num_splits_per_doc * num_docs) x model_max_length.
+            None types correspond to special tokens. The shape is (num_splits_per_doc * num_docs) x num_tokens_per_split.
         :param word_offset_mapping: List of (word, (char_start, char_end)) tuples for each word in a text. The shape is
             num_docs x num_words_per_doc.
         """
@@ -328,82 +447,48 @@ class EntityExtractor(BaseComponent):
         # e.g. model_outputs['overflow_to_sample_mapping'] = [0, 0, 1, 1, 1, 1] means first two elements of
         # predictions belong to document 0 and the other four elements belong to document 1.
         sample_mapping = model_outputs["overflow_to_sample_mapping"]
-        all_num_splits_per_doc = torch.zeros(sample_mapping[-1] + 1, dtype=torch.long)
-        for idx in sample_mapping:
-            all_num_splits_per_doc[idx] += 1
-
-        logits = model_outputs["logits"]  # (num_splits_per_doc * num_docs) x model_max_length x num_classes
-        input_ids = model_outputs["input_ids"]  # (num_splits_per_doc * num_docs) x model_max_length
-        offset_mapping = model_outputs["offset_mapping"]  # (num_splits_per_doc * num_docs) x model_max_length x 2
-        special_tokens_mask = model_outputs["special_tokens_mask"]  # (num_splits_per_doc * num_docs) x model_max_length
+        num_docs = len(sentence)
+        all_num_splits_per_doc = torch.bincount(sample_mapping, minlength=num_docs)
+        # Boundaries of the splits of each document, computed once for all documents
+        split_ends = torch.cumsum(all_num_splits_per_doc, dim=0).tolist()
+        split_starts = [0] + split_ends[:-1]
+        num_tokens = model_outputs["num_tokens"]  # (num_splits_per_doc * num_docs)
+        num_tokens_per_doc = (
+            torch.bincount(sample_mapping, weights=num_tokens.double(), minlength=num_docs).long().tolist()
+        )
+        has_entities_per_doc = (
+            torch.bincount(sample_mapping, weights=model_outputs["has_entities"].float(), minlength=num_docs) > 0
+        ).tolist()
+
+        # Split the token-level outputs into one view per document. The shapes per document are
+        # num_tokens_per_doc x num_classes for the scores, num_tokens_per_doc x 2 for the offset mapping and
+        # num_tokens_per_doc for the others.
+        token_level_keys = ["pred_ids", "pred_scores", "scores"]
+        outputs_per_doc = {
+            key: torch.split(model_outputs[key], num_tokens_per_doc) for key in token_level_keys if key in model_outputs
+        }
+        input_ids_per_doc = torch.split(model_outputs["input_ids"], num_tokens_per_doc)
+        offset_mapping_per_doc = torch.split(model_outputs["offset_mapping"], num_tokens_per_doc)
+        special_tokens_mask_per_doc = torch.split(model_outputs["special_tokens_mask"], num_tokens_per_doc)
 
         model_outputs_grouped_by_doc = []
-        bef_idx = 0
-        for i, num_splits_per_doc in enumerate(all_num_splits_per_doc):
-            aft_idx = bef_idx + num_splits_per_doc
-
-            logits_per_doc = logits[bef_idx:aft_idx].reshape(
-                1, -1, logits.shape[2]
-            )  # 1 x (num_splits_per_doc * model_max_length) x num_classes
-            input_ids_per_doc = input_ids[bef_idx:aft_idx].reshape(1, -1)  # 1 x (num_splits_per_doc * model_max_length)
-            offset_mapping_per_doc = offset_mapping[bef_idx:aft_idx].reshape(
-                1, -1, offset_mapping.shape[2]
-            )  # 1 x (num_splits_per_doc * model_max_length) x 2
-            special_tokens_mask_per_doc = special_tokens_mask[bef_idx:aft_idx].reshape(
-                1, -1
-            )  # 1 x (num_splits_per_doc * model_max_length)
-            sentence_per_doc = sentence[i]
-            word_ids_per_doc = list(
-                itertools.chain.from_iterable(word_ids[bef_idx:aft_idx])
-            )  # 1 x (num_splits_per_doc * model_max_length)
-            if word_offset_mapping is not None:
-                word_offset_mapping_per_doc = word_offset_mapping[i]  # 1 x num_words_per_doc
-
-            bef_idx += num_splits_per_doc
-
+        for i, (split_start, split_end) in enumerate(zip(split_starts, split_ends)):
             output = {
-                "logits": logits_per_doc,
-                "sentence": sentence_per_doc,
-                "input_ids": input_ids_per_doc,
-                "offset_mapping": offset_mapping_per_doc,
-                "special_tokens_mask": special_tokens_mask_per_doc,
-                "word_ids": word_ids_per_doc,
+                "sentence": sentence[i],
+                "input_ids": input_ids_per_doc[i][None],
+                "offset_mapping": offset_mapping_per_doc[i][None],
+                "special_tokens_mask": special_tokens_mask_per_doc[i][None],
+                "word_ids": list(itertools.chain.from_iterable(word_ids[split_start:split_end])),  # num_tokens_per_doc
+                "has_entities": has_entities_per_doc[i],
             }
+            for key, values in outputs_per_doc.items():
+                output[key] = values[i][None]
             if word_offset_mapping is not None:
-                output["word_offset_mapping"] = word_offset_mapping_per_doc
+                output["word_offset_mapping"] = word_offset_mapping[i]  # num_words_per_doc
 
             model_outputs_grouped_by_doc.append(output)
         return model_outputs_grouped_by_doc
 
-    def _flatten_predictions(self, predictions: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Flatten the predictions across the batch dimension.
-
-        :param predictions: List of model output dictionaries
-        """
-        flattened_predictions: Dict[str, Any] = {
-            "logits": [],
-            "input_ids": [],
-            "special_tokens_mask": [],
-            "offset_mapping": [],
-            "overflow_to_sample_mapping": [],
-        }
-        for pred in predictions:
-            flattened_predictions["logits"].append(pred["logits"])
-            flattened_predictions["input_ids"].append(pred["input_ids"])
-            flattened_predictions["special_tokens_mask"].append(pred["special_tokens_mask"])
-            flattened_predictions["offset_mapping"].append(pred["offset_mapping"])
-            flattened_predictions["overflow_to_sample_mapping"].append(pred["overflow_to_sample_mapping"])
-
-        flattened_predictions["logits"] = torch.vstack(flattened_predictions["logits"])
-        flattened_predictions["input_ids"] = torch.vstack(flattened_predictions["input_ids"])
-        flattened_predictions["special_tokens_mask"] = torch.vstack(flattened_predictions["special_tokens_mask"])
-        flattened_predictions["offset_mapping"] = torch.vstack(flattened_predictions["offset_mapping"])
-        # Make sure to hstack overflow_to_sample_mapping since it doesn't have a batch dimension
-        flattened_predictions["overflow_to_sample_mapping"] = torch.hstack(
-            flattened_predictions["overflow_to_sample_mapping"]
-        )
-        return flattened_predictions
-
     def extract(self, text: Union[str, List[str]], batch_size: int = 1):
         """
         This function can be called to perform entity extraction when using the node in isolation.
@@ -421,32 +506,121 @@ class EntityExtractor(BaseComponent):
         else:
             raise ValueError("The variable text must be a string, or a list of strings.")
 
+        predictions = list(self._extract_iter(text, batch_size=batch_size))
+
+        if is_single_text:
+            return predictions[0]  # type: ignore
+
+        return predictions
+
+    def _extract_iter(self, texts: List[str], batch_size: int = 1) -> Iterator[List[Dict]]:
+        """Generator yielding the entities extracted from each text, in the order of `texts`.
+
+        The texts are processed in chunks of `docs_per_chunk` texts, the entities of a chunk are yielded as soon as the
+        chunk is predicted and its model outputs are discarded.
+
+        :param texts: List of texts to extract entities from.
+        :param batch_size: Number of texts to make predictions on at a time.
+        """
+        for chunk_start in range(0, len(texts), self.docs_per_chunk):
+            yield from self._extract_chunk(texts[chunk_start : chunk_start + self.docs_per_chunk], batch_size)
+
+    def _extract_chunk(self, text: List[str], batch_size: int = 1) -> List[List[Dict]]:
+        """Extract the entities of a chunk of texts.
+
+        :param text: List of texts to extract entities from.
+        :param batch_size: Number of texts to make predictions on at a time.
+        """
         # Preprocess
         model_inputs = self.preprocess(text)
         word_offset_mapping = model_inputs.pop("word_offset_mapping", None)
         word_ids = model_inputs.pop("word_ids")
         sentence = model_inputs.pop("sentence")
-        dataset = TokenClassificationDataset(model_inputs.data)
-        dataloader = DataLoader(dataset, shuffle=False, batch_size=batch_size, num_workers=self.num_workers)
+        # ONNX Runtime takes its inputs as NumPy arrays and copies them to the GPU itself
+        input_device = torch.device("cpu") if self.onnx_session is not None else self.devices[0]
+        dataset = TokenClassificationDataset(
+            model_inputs.data,
+            pad_token_id=self.tokenizer.pad_token_id,
+            # Sequence lengths that are multiples of 8 let the GPU use tensor cores for the matrix multiplications
+            pad_to_multiple_of=8 if self.devices[0].type == "cuda" else None,
+            # The offsets and the mapping of the splits to their text are only needed to postprocess the predictions
+            forward_only=True,
+        )
+        # Batch splits of similar length together to minimize padding
+        split_lengths = dataset.num_tokens.tolist()
+        split_order = sorted(range(len(split_lengths)), key=split_lengths.__getitem__)
+        # The DataLoader only accepts prefetch_factor when batches are loaded by worker processes
+        dataloader_kwargs = {"prefetch_factor": self.prefetch_factor} if self.num_workers > 0 else {}
+        dataloader = DataLoader(
+            dataset,
+            sampler=split_order,
+            batch_size=batch_size,
+            num_workers=self.num_workers,
+            collate_fn=dataset.collate_fn,
+            # Pinned memory lets the batches be copied to the GPU asynchronously
+            pin_memory=input_device.type == "cuda",
+            **dataloader_kwargs,
+        )
+
+        # The tokens of all splits are concatenated in their original order, without padding. Only the predictions
+        # depend on the model, they are written into preallocated tensors as the batches are predicted.
+        # Each token only needs its top label and score, except for averaging the scores of the tokens of a word.
+        num_tokens = dataset.num_tokens
+        total_num_tokens = int(num_tokens.sum())
+        split_starts = dataset.split_starts
+        keep_scores = self.aggregation_strategy == "average"
+        predictions = {
+            "pred_ids": torch.empty(total_num_tokens, dtype=torch.long),
+            "pred_scores": torch.empty(total_num_tokens, dtype=torch.float32),
+            "num_tokens": num_tokens,
+            "has_entities": torch.ones(len(split_lengths), dtype=torch.bool),
+            "overflow_to_sample_mapping": dataset.overflow_to_sample_mapping,
+        }
+        if keep_scores:
+            predictions["scores"] = torch.empty(total_num_tokens, self.model.config.num_labels, dtype=torch.float32)
+        for key in ["input_ids", "special_tokens_mask", "offset_mapping"]:
+            predictions[key] = dataset.tokens[key]
 
         # Forward
-        predictions: List[Dict[str, Any]] = []
-        for batch in tqdm(dataloader, disable=not self.progress_bar, total=len(dataloader), desc="Extracting entities"):
-            batch = ensure_tensor_on_device(batch, device=self.devices[0])
+        ignored_labels = self._get_ignored_labels()
+        batch_start = 0
+        progress_bar = tqdm(
+            dataloader,
+            disable=not self.progress_bar,
+            total=len(dataloader),
+            desc="Extracting entities",
+            mininterval=0.5,
+        )
+        # Only the inputs of the model are needed on its device, the other fields stay on the CPU. The next batch is
+        # copied to the device while the model runs on the current one.
+        for batch in prefetch_to_device(progress_bar, device=input_device, keys=["input_ids", "attention_mask"]):
             with torch.inference_mode():
                 model_outputs = self.forward(batch)
-            model_outputs = ensure_tensor_on_device(model_outputs, device=torch.device("cpu"))
-            predictions.append(model_outputs)
-        predictions = self._flatten_predictions(predictions)  # type: ignore
+                # The top labels are selected on the model's device, only they are copied back in most cases
+                pred_scores, pred_ids = model_outputs["scores"].max(dim=-1)
+            batch_predictions = {"pred_ids": pred_ids, "pred_scores": pred_scores}
+            if keep_scores:
+                batch_predictions["scores"] = model_outputs["scores"]
+            batch_predictions = ensure_tensor_on_device(batch_predictions, device=torch.device("cpu"))
+            batch_splits = split_order[batch_start : batch_start + len(pred_ids)]
+            # Position of each unpadded token of the batch in the preallocated tensors
+            batch_num_tokens = num_tokens[batch_splits]
+            is_token = torch.arange(pred_ids.shape[1]) < batch_num_tokens[:, None]
+            token_positions = torch.arange(int(batch_num_tokens.sum())) + torch.repeat_interleave(
+                split_starts[batch_splits] - (torch.cumsum(batch_num_tokens, dim=0) - batch_num_tokens),
+                batch_num_tokens,
+            )
+            for key, values in batch_predictions.items():
+                predictions[key][token_positions] = values[is_token]
+            if ignored_labels is not None:
+                # Flag the splits where any token is predicted as an entity
+                is_entity = ~ignored_labels[batch_predictions["pred_ids"]] & ~model_outputs["special_tokens_mask"]
+                predictions["has_entities"][batch_splits] = is_entity.any(dim=1)
+            batch_start += len(pred_ids)
         predictions = self._group_predictions_by_doc(predictions, sentence, word_ids, word_offset_mapping)  # type: ignore
 
         # Postprocess
-        predictions = self.postprocess(predictions)  # type: ignore
-
-        if is_single_text:
-            return predictions[0]  # type: ignore
-
-        return predictions
+        return self.postprocess(predictions)  # type: ignore
 
     def extract_batch(self, texts: Union[List[str], List[List[str]]], batch_size: int = 1) -> List[List[Dict]]:
         """
@@ -495,19 +669,55 @@ def simplify_ner_for_qa(output):
 
     :param output: Output from a query pipeline
     """
-    compact_output = []
-    for answer in output["answers"]:
+    answers = output["answers"]
+    entities_per_answer: List[List[str]] = [[] for _ in answers]
+    # Answers from the same Document share its list of entities, they are all matched against it at once
+    answers_per_entity_list: Dict[int, List[int]] = {}
+    for answer_idx, answer in enumerate(answers):
+        answer_entities = answer.meta["entities"]
+        if len(answer_entities) <= 4:
+            # Building the arrays costs more than comparing a few entities one by one
+            answer_offset = answer.offsets_in_document[0]
+            answer_start, answer_end = answer_offset.start, answer_offset.end
+            entities_per_answer[answer_idx] = [
+                entity["word"]
+                for entity in answer_entities
+                if answer_start <= entity["start"] and entity["end"] <= answer_end
+            ]
+        else:
+            answers_per_entity_list.setdefault(id(answer_entities), []).append(answer_idx)
+
+    for answer_ids in answers_per_entity_list.values():
+        answer_entities = answers[answer_ids[0]].meta["entities"]
+        order, sorted_starts, sorted_ends = _sort_entity_spans(answer_entities)
+        answer_starts = np.fromiter(
+            (answers[idx].offsets_in_document[0].start for idx in answer_ids), dtype=np.int64, count=len(answer_ids)
+        )
+        answer_ends = np.fromiter(
+            (answers[idx].offsets_in_document[0].end for idx in answer_ids), dtype=np.int64, count=len(answer_ids)
+        )
+        # Only the entities starting within an answer can be part of it, they are found by binary search
+        firsts = np.searchsorted(sorted_starts, answer_starts, side="left")
+        lasts = np.searchsorted(sorted_starts, answer_ends, side="right")
+        for answer_idx, first, last, answer_end in zip(answer_ids, firsts, lasts, answer_ends):
+            is_in_answer = sorted_ends[first:last] <= answer_end
+            entity_ids = np.sort(order[first:last][is_in_answer])
+            entities_per_answer[answer_idx] = [answer_entities[idx]["word"] for idx in entity_ids]
+
+    return [{"answer": answer.answer, "entities": entities} for answer, entities in zip(answers, entities_per_answer)]
 
-        entities = []
-        for entity in answer.meta["entities"]:
-            if (
-                entity["start"] >= answer.offsets_in_document[0].start
-                and entity["end"] <= answer.offsets_in_document[0].end
-            ):
-                entities.append(entity["word"])
 
-        compact_output.append({"answer": answer.answer, "entities": entities})
-    return compact_output
+def _sort_entity_spans(entities: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sort the character spans of the entities by their start.
+
+    :param entities: List of entities with `start` and `end` character offsets.
+    :return: The indices of the entities in sorted order, their sorted starts and their ends in the same order.
+    """
+    # Both offsets of each entity are read in a single pass, by one C-level call per entity
+    spans = np.array([_get_entity_span(entity) for entity in entities], dtype=np.int64).reshape(-1, 2)
+    order = np.argsort(spans[:, 0], kind="stable")
+    sorted_spans = spans[order]
+    return order, sorted_spans[:, 0], sorted_spans[:, 1]
 
 
 class _EntityPostProcessor:
@@ -520,12 +730,21 @@ class _EntityPostProcessor:
     def __init__(self, model, tokenizer):
         self.model = model
         self.tokenizer = tokenizer
+        # Label of each label id, indexed with the predicted label ids
+        self.id2label = np.array(
+            [model.config.id2label[label_id] for label_id in range(model.config.num_labels)], dtype=object
+        )
+        # Token of each token id, to convert all the token ids of a document at once
+        vocab = tokenizer.get_vocab()
+        self.id2token = np.empty(max(vocab.values()) + 1, dtype=object)
+        for token, token_id in vocab.items():
+            self.id2token[token_id] = token
 
     def postprocess(
         self,
         model_outputs: Dict[str, Any],
         aggregation_strategy: Literal[None, "simple", "first", "average", "max"],
-        ignore_labels: List[str] = None,
+        ignore_labels: List[str],
     ) -> List[Dict[str, Any]]:
         """Postprocess the model outputs for a single Document.
 
@@ -547,34 +766,30 @@ class _EntityPostProcessor:
                        different tags. The scores will be averaged across tokens, and then the label with the maximum score is chosen.
             "max": Will use the SIMPLE strategy except that words, cannot end up with
                    different tags. Word entity will simply be the token with the maximum score.
-        :param ignore_labels: Optionally specify a list of labels to ignore. If None is specified it
-            defaults to `["O"]`.
+        :param ignore_labels: List of labels to ignore.
         """
-        if ignore_labels is None:
-            ignore_labels = ["O"]
-        logits = model_outputs["logits"][0].numpy()
+        # The per-document tensors are views of the outputs of all documents, `numpy()` shares their memory
+        pred_ids = model_outputs["pred_ids"][0].numpy()
+        pred_scores = model_outputs["pred_scores"][0].numpy()
+        scores = model_outputs["scores"][0].numpy() if "scores" in model_outputs else None
         sentence = model_outputs["sentence"]
-        input_ids = model_outputs["input_ids"][0]
+        input_ids = model_outputs["input_ids"][0].numpy()
         offset_mapping = model_outputs["offset_mapping"][0].numpy()
         special_tokens_mask = model_outputs["special_tokens_mask"][0].numpy()
         word_ids = model_outputs["word_ids"]
         word_offset_mapping = model_outputs.get("word_offset_mapping", None)
 
-        maxes = np.max(logits, axis=-1, keepdims=True)
-        shifted_exp = np.exp(logits - maxes)
-        scores = shifted_exp / shifted_exp.sum(axis=-1, keepdims=True)
-
         updated_offset_mapping = offset_mapping
         pre_entities = self.gather_pre_entities(
-            sentence, input_ids, scores, updated_offset_mapping, special_tokens_mask, word_ids
+            sentence, input_ids, pred_ids, pred_scores, updated_offset_mapping, special_tokens_mask, word_ids, scores
+        )
+        # The groups of ignored labels are dropped while grouping, before their words and scores are computed
+        entities = self.aggregate(
+            pre_entities,
+            aggregation_strategy,
+            word_offset_mapping=word_offset_mapping,
+            ignore_labels=set(ignore_labels),
         )
-        grouped_entities = self.aggregate(pre_entities, aggregation_strategy, word_offset_mapping=word_offset_mapping)
-        # Filter anything that is in self.ignore_labels
-        entities = [
-            entity
-            for entity in grouped_entities
-            if entity.get("entity", None) not in ignore_labels and entity.get("entity_group", None) not in ignore_labels
-        ]
         return entities
 
     def aggregate(
@@ -582,33 +797,35 @@ class _EntityPostProcessor:
         pre_entities: List[Dict[str, Any]],
         aggregation_strategy: Literal[None, "simple", "first", "average", "max"],
         word_offset_mapping: List[Tuple] = None,
+        ignore_labels: Optional[Set[str]] = None,
     ) -> List[Dict[str, Any]]:
         """Aggregate the `pre_entities` depending on the `aggregation_strategy`.
 
         :param pre_entities: List of entity predictions for each token in a text.
         :param aggregation_strategy: The strategy to fuse (or not) tokens based on the model prediction.
         :param word_offset_mapping: List of (word, (char_start, char_end)) tuples for each word in a text.
+        :param ignore_labels: Optionally specify a set of labels whose entity groups are left out.
         """
         if aggregation_strategy is None or aggregation_strategy == "simple":
-            entities = []
-            for pre_entity in pre_entities:
-                entity_idx = pre_entity["scores"].argmax()
-                score = pre_entity["scores"][entity_idx]
-                entity = {
-                    "entity": self.model.config.id2label[entity_idx],
-                    "score": score,
+            # The label and score of each token are already selected in `gather_pre_entities`
+            labels = self.id2label[[pre_entity["entity_idx"] for pre_entity in pre_entities]]
+            entities = [
+                {
+                    "entity": label,
+                    "score": pre_entity["score"],
                     "index": pre_entity["index"],
                     "word": pre_entity["word"],
                     "start": pre_entity["start"],
                     "end": pre_entity["end"],
                 }
-                entities.append(entity)
+                for pre_entity, label in zip(pre_entities, labels)
+            ]
         else:
             entities = self.aggregate_words(pre_entities, aggregation_strategy)
             if word_offset_mapping is not None:
                 entities = self.update_character_spans(entities, word_offset_mapping)
 
-        return self.group_entities(entities)
+        return self.group_entities(entities, ignore_labels=ignore_labels)
 
     @staticmethod
     def update_character_spans(
@@ -640,58 +857,60 @@ class _EntityPostProcessor:
         self,
         sentence: Union[str, List[str]],
         input_ids: np.ndarray,
-        scores: np.ndarray,
+        pred_ids: np.ndarray,
+        pred_scores: np.ndarray,
         offset_mapping: np.ndarray,
         special_tokens_mask: np.ndarray,
         word_ids: List,
+        scores: Optional[np.ndarray] = None,
     ) -> List[Dict[str, Any]]:
         """Gather the pre-entities from the model outputs.
 
         :param sentence: The original text. Will be a list of words if `self.pre_split_text` is set to True.
         :param input_ids: Array of token ids.
-        :param scores: Array of confidence scores of the model for the classification of each token.
+        :param pred_ids: Array of the label predicted for each token.
+        :param pred_scores: Array of the confidence score of the label predicted for each token.
         :param offset_mapping: Array of (char_start, char_end) tuples for each token.
         :param special_tokens_mask: Special tokens mask used to identify which tokens are special.
         :param word_ids: List of integers or None types that provides the token index to word id mapping. None types
             correspond to special tokens.
+        :param scores: Optional array of confidence scores of the model for the classification of each token into each
+            label. Only needed for the "average" aggregation strategy.
         """
-        previous_word_id = -1
-        pre_entities = []
-        for token_idx, token_scores in enumerate(scores):
-            current_word_id = word_ids[token_idx]
-
-            # Filter special_tokens, they should only occur
-            # at the sentence boundaries since we're not encoding pairs of
-            # sentences so we don't have to keep track of those.
-            if special_tokens_mask[token_idx]:
-                continue
-
-            word = self.tokenizer.convert_ids_to_tokens(int(input_ids[token_idx]))
-
-            if current_word_id != previous_word_id:
-                is_subword = False
-            else:
-                is_subword = True
+        # Filter special_tokens, they should only occur
+        # at the sentence boundaries since we're not encoding pairs of
+        # sentences so we don't have to keep track of those.
+        token_indices = np.flatnonzero(special_tokens_mask == 0)
+        token_ids = input_ids[token_indices]
+        words = self.id2token[token_ids]
+        is_unknown = token_ids == self.tokenizer.unk_token_id
+        token_word_ids = [word_ids[token_idx] for token_idx in token_indices]
+        # A token is a subword if it belongs to the same word as the previous token
+        is_subword = [False] + [
+            word_id == previous_word_id for word_id, previous_word_id in zip(token_word_ids[1:], token_word_ids[:-1])
+        ]
 
+        pre_entities = []
+        for i, token_idx in enumerate(token_indices.tolist()):
             start_ind, end_ind = offset_mapping[token_idx]
-            if int(input_ids[token_idx]) == self.tokenizer.unk_token_id:
-                if isinstance(sentence, list):
-                    word = sentence[current_word_id][start_ind:end_ind]
-                else:
-                    word = sentence[start_ind:end_ind]
-                is_subword = False
-
             pre_entity = {
-                "word": word,
-                "scores": token_scores,
+                "word": words[i],
+                "entity_idx": pred_ids[token_idx],
+                "score": pred_scores[token_idx],
                 "start": start_ind,
                 "end": end_ind,
                 "index": token_idx,
-                "is_subword": is_subword,
+                "is_subword": is_subword[i],
             }
+            if is_unknown[i]:
+                if isinstance(sentence, list):
+                    pre_entity["word"] = sentence[token_word_ids[i]][start_ind:end_ind]
+                else:
+                    pre_entity["word"] = sentence[start_ind:end_ind]
+                pre_entity["is_subword"] = False
+            if scores is not None:
+                pre_entity["scores"] = scores[token_idx]
             pre_entities.append(pre_entity)
-
-            previous_word_id = current_word_id
         return pre_entities
 
     def aggregate_word(
@@ -705,21 +924,17 @@ class _EntityPostProcessor:
         word = self.tokenizer.convert_tokens_to_string([entity["word"] for entity in entities])
         tokens = [entity["word"] for entity in entities]
         if aggregation_strategy == "first":
-            scores = entities[0]["scores"]
-            idx = scores.argmax()
-            score = scores[idx]
-            entity = self.model.config.id2label[idx]
+            score = entities[0]["score"]
+            entity = self.id2label[entities[0]["entity_idx"]]
         elif aggregation_strategy == "max":
-            max_entity = max(entities, key=lambda entity: entity["scores"].max())
-            scores = max_entity["scores"]
-            idx = scores.argmax()
-            score = scores[idx]
-            entity = self.model.config.id2label[idx]
+            max_entity = max(entities, key=lambda entity: entity["score"])
+            score = max_entity["score"]
+            entity = self.id2label[max_entity["entity_idx"]]
         elif aggregation_strategy == "average":
             scores = np.stack([entity["scores"] for entity in entities])
             average_scores = np.nanmean(scores, axis=0)
             entity_idx = average_scores.argmax()
-            entity = self.model.config.id2label[entity_idx]
+            entity = self.id2label[entity_idx]
             score = average_scores[entity_idx]
         else:
             raise ValueError("Invalid aggregation_strategy")
@@ -805,12 +1020,17 @@ class _EntityPostProcessor:
             tag = entity_name
         return bi, tag
 
-    def group_entities(self, entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def group_entities(
+        self, entities: List[Dict[str, Any]], ignore_labels: Optional[Set[str]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Find and group together the adjacent tokens (or words) with the same entity predicted.
 
         :param entities: List of predicted entities.
+        :param ignore_labels: Optionally specify a set of labels whose entity groups are left out.
         """
+        if not ignore_labels:
+            ignore_labels = set()
 
         entity_groups = []
         entity_group_disagg: List[Dict[str, Any]] = []
@@ -833,9 +1053,10 @@ class _EntityPostProcessor:
             else:
                 # If the current entity is different from the previous entity
                 # aggregate the disaggregated entity group
-                entity_groups.append(self.group_sub_entities(entity_group_disagg))
+                if entity_group_disagg[0]["entity"].split("-")[-1] not in ignore_labels:
+                    entity_groups.append(self.group_sub_entities(entity_group_disagg))
                 entity_group_disagg = [entity]
-        if entity_group_disagg:
+        if entity_group_disagg and entity_group_disagg[0]["entity"].split("-")[-1] not in ignore_labels:
             # it's the last entity, add it to the entity groups
             entity_groups.append(self.group_sub_entities(entity_group_disagg))
 
@@ -847,29 +1068,73 @@ class TokenClassificationDataset(Dataset):
 
     This is a wrapper class to create a Pytorch dataset object from the data attribute of a
     `transformers.tokenization_utils_base.BatchEncoding` object.
+    The samples are expected to be unpadded. Their tokens are concatenated into one tensor per field. The dataset only
+    yields the index of each sample, use `collate_fn` to gather the samples of a batch and pad them to the length of
+    its longest sample.
 
     :param model_inputs: The data attribute of the output from a HuggingFace tokenizer which is needed to evaluate the
         forward pass of a token classification model.
+    :param pad_token_id: The id of the padding token of the tokenizer.
+    :param pad_to_multiple_of: If set, pad each batch to a multiple of this value instead of exactly the length of its
+        longest sample.
+    :param forward_only: Whether to only collate the fields used along the forward pass: the model inputs and the
+        special tokens mask. The offset mapping and the overflow to sample mapping are then only available in
+        `tokens` and `overflow_to_sample_mapping`.
     """
 
-    def __init__(self, model_inputs: dict):
-        self.model_inputs = model_inputs
-        self._len = len(model_inputs["input_ids"])
+    def __init__(
+        self,
+        model_inputs: dict,
+        pad_token_id: int = 0,
+        pad_to_multiple_of: Optional[int] = None,
+        forward_only: bool = False,
+    ):
+        self.pad_to_multiple_of = pad_to_multiple_of
+        self.forward_only = forward_only
+        # Padding is marked as special token so that it is never turned into an entity.
+        # The attention mask of unpadded samples only holds ones, it is not stored but derived from the padding.
+        self.padding_values = {
+            "input_ids": (pad_token_id, torch.long),
+            "special_tokens_mask": (1, torch.bool),
+            "offset_mapping": (0, torch.long),
+        }
+        self.num_tokens = torch.tensor([len(input_ids) for input_ids in model_inputs["input_ids"]], dtype=torch.long)
+        self.split_starts = torch.cumsum(self.num_tokens, dim=0) - self.num_tokens
+        self.tokens = {
+            key: torch.tensor(list(itertools.chain.from_iterable(model_inputs[key])), dtype=dtype)
+            for key, (_, dtype) in self.padding_values.items()
+        }
+        self.overflow_to_sample_mapping = torch.tensor(model_inputs["overflow_to_sample_mapping"], dtype=torch.long)
+        self._len = len(self.num_tokens)
 
     def __getitem__(self, item):
-        input_ids = self.model_inputs["input_ids"][item]
-        attention_mask = self.model_inputs["attention_mask"][item]
-        special_tokens_mask = self.model_inputs["special_tokens_mask"][item]
-        offset_mapping = self.model_inputs["offset_mapping"][item]
-        overflow_to_sample_mapping = self.model_inputs["overflow_to_sample_mapping"][item]
-        single_input = {
-            "input_ids": input_ids,
-            "attention_mask": attention_mask,
-            "special_tokens_mask": special_tokens_mask,
-            "offset_mapping": offset_mapping,
-            "overflow_to_sample_mapping": overflow_to_sample_mapping,
-        }
-        return single_input
+        return item
 
     def __len__(self):
         return self._len
+
+    def collate_fn(self, batch: List[int]) -> Dict[str, torch.Tensor]:
+        """Gather the samples of a batch, pad them to the length of its longest sample and stack them into tensors.
+
+        :param batch: List of sample indices returned by `__getitem__`.
+        """
+        batch_ids = torch.tensor(batch, dtype=torch.long)
+        num_tokens = self.num_tokens[batch_ids]
+        max_len = int(num_tokens.max())
+        if self.pad_to_multiple_of is not None:
+            max_len = -(-max_len // self.pad_to_multiple_of) * self.pad_to_multiple_of
+        # Each field of the batch is filled with its padding value, then its tokens are gathered at once
+        positions = torch.arange(max_len)
+        is_token = positions < num_tokens[:, None]
+        token_positions = (self.split_starts[batch_ids][:, None] + positions)[is_token]
+        keys = ["input_ids", "special_tokens_mask"] if self.forward_only else list(self.padding_values)
+        # The masks only hold a few distinct values, narrow dtypes reduce the size of the host to device copies
+        collated_batch = {"attention_mask": is_token.to(torch.int32)}
+        for key in keys:
+            value, dtype = self.padding_values[key]
+            tokens = self.tokens[key]
+            collated_batch[key] = torch.full((len(batch), max_len) + tokens.shape[1:], value, dtype=dtype)
+            collated_batch[key][is_token] = tokens[token_positions]
+        if not self.forward_only:
+            collated_batch["overflow_to_sample_mapping"] = self.overflow_to_sample_mapping[batch_ids]
+        return collated_batch
@@ -35,6 +35,8 @@ class MultiModalRetriever(BaseRetriever):
         devices: Optional[List[Union[str, torch.device]]] = None,
         use_auth_token: Optional[Union[str, bool]] = None,
         scale_score: bool = True,
+        quantize: bool = False,
+        autocast: bool = False,
     ):
         """
         Retriever that uses a multiple encoder to jointly retrieve among a database consisting of different
@@ -74,6 +76,10 @@ class MultiModalRetriever(BaseRetriever):
             If true (default) similarity scores (e.g. cosine or dot_product) which naturally have a different value
             range are scaled to a range of [0,1], where 1 means extremely relevant.
             Otherwise raw similarity scores (for example, cosine or dot_product) are used.
+        :param quantize: Whether to apply dynamic int8 quantization to the embedding models. This speeds up inference
+            on CPU at the cost of a small loss in accuracy. Ignored when running on GPU.
+        :param autocast: Whether to run the embedding models in mixed precision (bfloat16 or float16). This speeds up
+            inference on recent GPUs at the cost of a small loss in accuracy. Ignored when running on CPU.
         """
         super().__init__()
 
@@ -90,6 +96,8 @@ class MultiModalRetriever(BaseRetriever):
             progress_bar=progress_bar,
             devices=devices,
             use_auth_token=use_auth_token,
+            quantize=quantize,
+            autocast=autocast,
         )
 
         # Try to reuse the same embedder for queries if there is overlap
@@ -104,6 +112,8 @@ class MultiModalRetriever(BaseRetriever):
                 progress_bar=progress_bar,
                 devices=devices,
                 use_auth_token=use_auth_token,
+                quantize=quantize,
+                autocast=autocast,
             )
 
         self.document_store = document_store
@@ -1,4 +1,4 @@
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Dict, Any, Iterable, Iterator
 
 import torch
 from torch.utils.data import Dataset
@@ -15,26 +15,75 @@ class ListDataset(Dataset):
         return self.original_list[i]
 
 
-def ensure_tensor_on_device(inputs: Union[dict, list, tuple, torch.Tensor], device: torch.device):
+def ensure_tensor_on_device(
+    inputs: Union[dict, list, tuple, torch.Tensor], device: torch.device, non_blocking: bool = False
+):
     """Utility function to check that all torch tensors present in `inputs` are sent to the correct device.
 
     :param inputs: Contains the torch tensors that will be sent to `device`.
     :param device: The torch device to send the tensors to.
+    :param non_blocking: Whether to copy the tensors asynchronously. Only has an effect when copying tensors
+        in pinned memory to a GPU.
     """
     if isinstance(inputs, dict):
-        return {name: ensure_tensor_on_device(tensor, device) for name, tensor in inputs.items()}
+        return {name: ensure_tensor_on_device(tensor, device, non_blocking) for name, tensor in inputs.items()}
     elif isinstance(inputs, list):
-        return [ensure_tensor_on_device(item, device) for item in inputs]
+        return [ensure_tensor_on_device(item, device, non_blocking) for item in inputs]
     elif isinstance(inputs, tuple):
-        return tuple(ensure_tensor_on_device(item, device) for item in inputs)
+        return tuple(ensure_tensor_on_device(item, device, non_blocking) for item in inputs)
     elif isinstance(inputs, torch.Tensor):
         if device == torch.device("cpu") and inputs.dtype in {torch.float16, torch.bfloat16}:
             inputs = inputs.float()
-        return inputs.to(device)
+        return inputs.to(device, non_blocking=non_blocking)
     else:
         return inputs
 
 
+def prefetch_to_device(
+    batches: Iterable[Dict[str, Any]], device: torch.device, keys: List[str]
+) -> Iterator[Dict[str, Any]]:
+    """Send the tensors stored under `keys` in each batch to `device`, copying the next batch while the current one
+    is being processed.
+
+    On CUDA devices the copies are issued on a separate stream, so they overlap with the computations launched on the
+    current stream. The copies are asynchronous only if the batches are in pinned memory.
+
+    :param batches: Iterable of batches, for example a `DataLoader`.
+    :param device: The torch device to send the tensors to.
+    :param keys: The keys of the tensors of each batch that are sent to `device`, the other values are left as is.
+    """
+    if device.type != "cuda":
+        for batch in batches:
+            for key in keys:
+                batch[key] = ensure_tensor_on_device(batch[key], device=device)
+            yield batch
+        return
+
+    copy_stream = torch.cuda.Stream(device=device)
+
+    def copy_to_device(batch):
+        with torch.cuda.stream(copy_stream):
+            for key in keys:
+                batch[key] = ensure_tensor_on_device(batch[key], device=device, non_blocking=True)
+        return batch
+
+    batch_iterator = iter(batches)
+    next_batch = next(batch_iterator, None)
+    if next_batch is not None:
+        next_batch = copy_to_device(next_batch)
+    while next_batch is not None:
+        current_stream = torch.cuda.current_stream(device)
+        current_stream.wait_stream(copy_stream)
+        batch = next_batch
+        for key in keys:
+            # The tensors are allocated on the copy stream but used on the current stream
+            batch[key].record_stream(current_stream)
+        next_batch = next(batch_iterator, None)
+        if next_batch is not None:
+            next_batch = copy_to_device(next_batch)
+        yield batch
+
+
 def get_devices(devices: Optional[List[Union[str, torch.device]]]) -> List[torch.device]:
     """
     Convert a list of device names into a list of Torch devices,
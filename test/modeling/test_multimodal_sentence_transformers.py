@@ -0,0 +1,48 @@
+import torch
+
+from haystack.modeling.model.multimodal.sentence_transformers import HaystackSentenceTransformerModel
+
+
+SENTENCE_TRANSFORMERS_MODEL = "sentence-transformers/paraphrase-MiniLM-L3-v2"
+
+
+def test_sentence_transformers_models_share_weights():
+    first = HaystackSentenceTransformerModel(SENTENCE_TRANSFORMERS_MODEL, model_type="bert", content_type="text")
+    second = HaystackSentenceTransformerModel(SENTENCE_TRANSFORMERS_MODEL, model_type="bert", content_type="text")
+
+    assert first.model is not second.model
+    for first_parameter, second_parameter in zip(first.model.parameters(), second.model.parameters()):
+        assert first_parameter.data_ptr() == second_parameter.data_ptr()
+
+
+def test_sentence_transformers_model_to_does_not_move_shared_weights():
+    first = HaystackSentenceTransformerModel(SENTENCE_TRANSFORMERS_MODEL, model_type="bert", content_type="text")
+    second = HaystackSentenceTransformerModel(SENTENCE_TRANSFORMERS_MODEL, model_type="bert", content_type="text")
+    second.to([torch.device("cpu")])
+
+    first.to([torch.device("meta")])
+
+    assert all(parameter.device.type == "meta" for parameter in first.model.parameters())
+    assert all(parameter.device.type == "cpu" for parameter in second.model.parameters())
+
+
+def test_sentence_transformers_model_encodes_across_replicas():
+    single = HaystackSentenceTransformerModel(SENTENCE_TRANSFORMERS_MODEL, model_type="bert", content_type="text")
+    single.to([torch.device("cpu")])
+    replicated = HaystackSentenceTransformerModel(SENTENCE_TRANSFORMERS_MODEL, model_type="bert", content_type="text")
+    replicated.to([torch.device("cpu")] * 3)
+    assert len(replicated.replicas) == 2
+
+    data = [f"This is the sentence number {i}" + " and more" * i for i in range(7)]
+    # More items than replicas, and fewer items than replicas
+    for texts in [data, data[:2]]:
+        output = replicated.encode(texts)
+        assert output.shape == (len(texts), single.embedding_dim)
+        assert torch.allclose(output, single.encode(texts), atol=1e-5)
+
+
+def test_sentence_transformers_model_encodes_empty_data():
+    model = HaystackSentenceTransformerModel(SENTENCE_TRANSFORMERS_MODEL, model_type="bert", content_type="text")
+    model.to([torch.device("cpu")] * 2)
+
+    assert model.encode([]).shape == (0, model.embedding_dim)
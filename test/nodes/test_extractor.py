@@ -1,4 +1,5 @@
 import pytest
+import torch
 
 from haystack.nodes import TextConverter
 from haystack.nodes.retriever.sparse import BM25Retriever
@@ -6,6 +7,8 @@ from haystack.nodes.reader import FARMReader
 from haystack.pipelines import Pipeline
 
 from haystack.nodes.extractor import EntityExtractor, simplify_ner_for_qa
+from haystack.nodes.extractor.entity import TokenClassificationDataset
+from haystack.schema import Answer, Span
 
 from ..conftest import SAMPLES_PATH
 
@@ -93,6 +96,53 @@ def test_extractor_output_simplifier(document_store_with_docs):
     assert simplified[0] == {"answer": "Carla and I", "entities": ["Carla"]}
 
 
+def test_simplify_ner_for_qa():
+    def entity(text, word):
+        start = text.index(word)
+        return {"entity_group": "PER", "word": word, "start": start, "end": start + len(word)}
+
+    def answer(text, answer_text, entities):
+        start = text.index(answer_text)
+        return Answer(
+            answer=answer_text,
+            offsets_in_document=[Span(start=start, end=start + len(answer_text))],
+            meta={"entities": entities},
+        )
+
+    text = "Carla and Paul live in Berlin with Arya, Debra, Jon Snow and Sansa."
+    # Entities of a Document are shared by all its answers, they are not necessarily sorted
+    entities = [
+        entity(text, "Jon Snow"),
+        entity(text, "Carla"),
+        entity(text, "Berlin"),
+        entity(text, "Arya"),
+        entity(text, "Paul"),
+        entity(text, "Debra"),
+        entity(text, "Sansa"),
+        entity(text, "Jon"),
+    ]
+    other_text = "Tyrion met Bran in Winterfell."
+    few_entities = [entity(other_text, "Tyrion"), entity(other_text, "Winterfell")]
+    output = {
+        "answers": [
+            answer(text, "Carla and Paul", entities),
+            answer(text, "Arya, Debra, Jon", entities),
+            answer(other_text, "Tyrion met Bran", few_entities),
+            answer(text, "live in", entities),
+            answer(text, "Jon Snow and Sansa", entities),
+        ]
+    }
+
+    assert simplify_ner_for_qa(output) == [
+        {"answer": "Carla and Paul", "entities": ["Carla", "Paul"]},
+        # "Jon Snow" starts within the answer but ends after it
+        {"answer": "Arya, Debra, Jon", "entities": ["Arya", "Debra", "Jon"]},
+        {"answer": "Tyrion met Bran", "entities": ["Tyrion"]},
+        {"answer": "live in", "entities": []},
+        {"answer": "Jon Snow and Sansa", "entities": ["Jon Snow", "Sansa", "Jon"]},
+    ]
+
+
 @pytest.mark.parametrize("document_store", ["elasticsearch"], indirect=True)
 def test_extractor_indexing(document_store):
     doc_path = SAMPLES_PATH / "docs" / "doc_2.txt"
@@ -216,3 +266,161 @@ def test_extract_method_simple_aggregation():
         {"entity_group": "PER", "word": "De", "start": 30, "end": 32},
         {"entity_group": "LOC", "word": "##bra", "start": 32, "end": 35},
     ]
+
+
+def test_extract_method_onnx():
+    ner = EntityExtractor(model_name_or_path="elastic/distilbert-base-cased-finetuned-conll03-english", max_seq_len=6)
+    ner_onnx = EntityExtractor(
+        model_name_or_path="elastic/distilbert-base-cased-finetuned-conll03-english", max_seq_len=6, use_onnx=True
+    )
+
+    text = "I live in Berlin with my wife Debra."
+    output = ner.extract(text)
+    output_onnx = ner_onnx.extract(text)
+    assert [x.pop("score") for x in output] == pytest.approx([x.pop("score") for x in output_onnx], abs=1e-4)
+    assert output == output_onnx
+
+
+@pytest.mark.parametrize("aggregation_strategy", [None, "simple", "first", "average", "max"])
+@pytest.mark.parametrize("ignore_labels", [None, ["O", "PER"], ["O", "PER", "ORG", "LOC", "MISC"]])
+def test_extract_method_ignore_labels(aggregation_strategy, ignore_labels):
+    ner = EntityExtractor(
+        model_name_or_path="elastic/distilbert-base-cased-finetuned-conll03-english",
+        aggregation_strategy=aggregation_strategy,
+        ignore_labels=ignore_labels,
+    )
+    ner_without_ignored_labels = EntityExtractor(
+        model_name_or_path="elastic/distilbert-base-cased-finetuned-conll03-english",
+        aggregation_strategy=aggregation_strategy,
+        ignore_labels=[],
+    )
+
+    texts = ["it is what it is.", "Hello my name is Arya.", "I live in Berlin with my wife Debra."]
+    output = ner.extract(texts)
+
+    # Ignoring labels is the same as dropping their entity groups from all predictions
+    ignored = ["O"] if ignore_labels is None else ignore_labels
+    expected = [
+        [entity for entity in entities if entity["entity_group"] not in ignored]
+        for entities in ner_without_ignored_labels.extract(texts)
+    ]
+    assert output == expected
+    if len(ignored) > 2:
+        # Every label is ignored
+        assert output == [[], [], []]
+
+
+class FixedScoresModel(torch.nn.Module):
+    """
+    Predicts "O" and "B-PER" for every other token. "B-LOC" is never the top label of a token, but it has the highest
+    average score over the tokens of any word made of several tokens.
+    """
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+        probabilities = torch.full((2, config.num_labels), 1e-6)
+        probabilities[0, [config.label2id["O"], config.label2id["B-LOC"], config.label2id["B-PER"]]] = torch.tensor(
+            [0.5, 0.45, 0.05]
+        )
+        probabilities[1, [config.label2id["B-PER"], config.label2id["B-LOC"], config.label2id["O"]]] = torch.tensor(
+            [0.5, 0.45, 0.05]
+        )
+        self.register_buffer("token_logits", probabilities.log())
+
+    def forward(self, input_ids, attention_mask=None, **kwargs):
+        positions = torch.arange(input_ids.shape[1]) % 2
+        return (self.token_logits[positions].expand(input_ids.shape[0], -1, -1),)
+
+
+@pytest.mark.parametrize("aggregation_strategy", [None, "simple", "first", "average", "max"])
+def test_extract_method_entities_from_ignored_token_labels(aggregation_strategy):
+    ner = EntityExtractor(
+        model_name_or_path="elastic/distilbert-base-cased-finetuned-conll03-english",
+        aggregation_strategy=aggregation_strategy,
+        ignore_labels=["O", "PER"],
+        use_gpu=False,
+    )
+    ner.model = FixedScoresModel(ner.model.config)
+
+    output = ner.extract("I live in Winterfell.")
+
+    if aggregation_strategy == "average":
+        # All tokens are predicted with an ignored label, but the averaged scores of a word still make it an entity
+        assert output
+        assert all(entity["entity_group"] == "LOC" for entity in output)
+    else:
+        assert output == []
+
+
+@pytest.fixture
+def token_classification_inputs():
+    # Three splits of unequal lengths, the last one overflows from a second sample
+    return {
+        "input_ids": [[101, 5, 6, 102], [101, 7, 102], [101, 8, 9, 10, 11, 102]],
+        "special_tokens_mask": [[1, 0, 0, 1], [1, 0, 1], [1, 0, 0, 0, 0, 1]],
+        "offset_mapping": [
+            [(0, 0), (0, 2), (3, 5), (0, 0)],
+            [(0, 0), (0, 4), (0, 0)],
+            [(0, 0), (0, 1), (2, 3), (4, 5), (6, 7), (0, 0)],
+        ],
+        "overflow_to_sample_mapping": [0, 0, 1],
+    }
+
+
+def test_token_classification_dataset_collate_fn_pads_batch(token_classification_inputs):
+    dataset = TokenClassificationDataset(token_classification_inputs, pad_token_id=3)
+    assert len(dataset) == 3
+
+    batch = dataset.collate_fn([dataset[0], dataset[1]])
+
+    assert set(batch) == {
+        "input_ids",
+        "attention_mask",
+        "special_tokens_mask",
+        "offset_mapping",
+        "overflow_to_sample_mapping",
+    }
+    assert batch["input_ids"].tolist() == [[101, 5, 6, 102], [101, 7, 102, 3]]
+    assert batch["attention_mask"].tolist() == [[1, 1, 1, 1], [1, 1, 1, 0]]
+    assert batch["special_tokens_mask"].tolist() == [[True, False, False, True], [True, False, True, True]]
+    assert batch["offset_mapping"].tolist() == [[[0, 0], [0, 2], [3, 5], [0, 0]], [[0, 0], [0, 4], [0, 0], [0, 0]]]
+    assert batch["overflow_to_sample_mapping"].tolist() == [0, 0]
+
+
+def test_token_classification_dataset_collate_fn_gathers_tokens_of_unequal_splits(token_classification_inputs):
+    dataset = TokenClassificationDataset(token_classification_inputs, pad_token_id=3)
+
+    batch = dataset.collate_fn([2, 0, 1])
+
+    assert batch["input_ids"].tolist() == [[101, 8, 9, 10, 11, 102], [101, 5, 6, 102, 3, 3], [101, 7, 102, 3, 3, 3]]
+    assert batch["offset_mapping"][0].tolist() == [[0, 0], [0, 1], [2, 3], [4, 5], [6, 7], [0, 0]]
+    assert batch["attention_mask"].sum(dim=1).tolist() == [6, 4, 3]
+    assert batch["overflow_to_sample_mapping"].tolist() == [1, 0, 0]
+
+
+def test_token_classification_dataset_collate_fn_pad_to_multiple_of(token_classification_inputs):
+    dataset = TokenClassificationDataset(token_classification_inputs, pad_token_id=3, pad_to_multiple_of=8)
+
+    batch = dataset.collate_fn([0, 2])
+
+    for key in ["input_ids", "attention_mask", "special_tokens_mask", "offset_mapping"]:
+        assert batch[key].shape[:2] == (2, 8)
+    assert batch["input_ids"][1].tolist() == [101, 8, 9, 10, 11, 102, 3, 3]
+    assert batch["attention_mask"][1].tolist() == [1, 1, 1, 1, 1, 1, 0, 0]
+    assert batch["special_tokens_mask"][1, 6:].all()
+
+    # Batches that already have a multiple of the length are not padded further
+    assert dataset.collate_fn([0])["input_ids"].shape == (1, 8)
+
+
+def test_token_classification_dataset_collate_fn_forward_only(token_classification_inputs):
+    dataset = TokenClassificationDataset(token_classification_inputs, pad_token_id=3, forward_only=True)
+
+    batch = dataset.collate_fn([1, 2])
+
+    assert set(batch) == {"input_ids", "attention_mask", "special_tokens_mask"}
+    assert batch["input_ids"].tolist() == [[101, 7, 102, 3, 3, 3], [101, 8, 9, 10, 11, 102]]
+    # The fields left out of the batches are still available for postprocessing
+    assert dataset.tokens["offset_mapping"].shape == (13, 2)
+    assert dataset.overflow_to_sample_mapping.tolist() == [0, 0, 1]
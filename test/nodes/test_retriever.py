@@ -8,6 +8,7 @@ from typing import Dict, List, Optional, Union
 
 import pytest
 import numpy as np
+import torch
 import pandas as pd
 from pandas.testing import assert_frame_equal
 from elasticsearch import Elasticsearch
@@ -25,6 +26,7 @@ from haystack.document_stores import MilvusDocumentStore
 from haystack.nodes.retriever.dense import DensePassageRetriever, EmbeddingRetriever, TableTextRetriever
 from haystack.nodes.retriever.sparse import BM25Retriever, FilterRetriever, TfidfRetriever
 from haystack.nodes.retriever.multimodal import MultiModalRetriever
+from haystack.nodes.retriever.multimodal.embedder import MultiModalEmbedder
 
 from ..conftest import SAMPLES_PATH, MockRetriever
 
@@ -775,6 +777,47 @@ def image_docs() -> List[Document]:
     ]
 
 
+class MockMultiModalModel:
+    def __init__(self, offset: float):
+        self.offset = offset
+        self.model_name_or_path = "mock"
+        self.embedding_dim = 1
+
+    def encode(self, data: List[str]) -> torch.Tensor:
+        return torch.tensor([[self.offset + len(item)] for item in data])
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("batch_size", [1, 2, 4, 16])
+def test_multimodal_embedder_keeps_document_order(monkeypatch, batch_size):
+    models = {"text": MockMultiModalModel(offset=100), "table": MockMultiModalModel(offset=200)}
+    monkeypatch.setattr(
+        "haystack.nodes.retriever.multimodal.embedder.get_model", lambda content_type, **kwargs: models[content_type]
+    )
+    embedder = MultiModalEmbedder(
+        embedding_models={"text": "mock", "table": "mock"}, embed_meta_fields=[], progress_bar=False, devices=["cpu"]
+    )
+    docs = [
+        Document(content="A rather long text"),
+        Document(content="Short"),
+        Document(content=pd.DataFrame({"City": ["Berlin", "Rome"]}), content_type="table"),
+        Document(content="Medium text"),
+        Document(content=pd.DataFrame({"Mountain": ["K2"]}), content_type="table"),
+        Document(content="Tiny"),
+    ]
+
+    embeddings = embedder.embed(docs, batch_size=batch_size)
+
+    assert embeddings[:, 0].tolist() == [
+        100 + len("A rather long text"),
+        100 + len("Short"),
+        200 + len("City Berlin Rome"),
+        100 + len("Medium text"),
+        200 + len("Mountain K2"),
+        100 + len("Tiny"),
+    ]
+
+
 @pytest.mark.integration
 def test_multimodal_text_retrieval(text_docs: List[Document]):
     retriever = MultiModalRetriever(
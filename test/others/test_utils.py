@@ -4,6 +4,7 @@ from random import random
 import numpy as np
 import pytest
 import pandas as pd
+import torch
 from pathlib import Path
 
 import responses
@@ -18,6 +19,7 @@ from haystack.utils.augment_squad import augment_squad
 from haystack.utils.reflection import retry_with_exponential_backoff
 from haystack.utils.squad_data import SquadData
 from haystack.utils.context_matching import calculate_context_similarity, match_context, match_contexts
+from haystack.utils.torch_utils import prefetch_to_device
 
 from ..conftest import DC_API_ENDPOINT, DC_API_KEY, MOCK_DC, SAMPLES_PATH, deepset_cloud_fixture
 
@@ -1219,3 +1221,42 @@ def test_exponential_backoff():
         return f"Hello {name}"
 
     assert greet2("John") == "Hello John"
+
+
+@pytest.mark.parametrize(
+    "device",
+    [
+        torch.device("cpu"),
+        pytest.param(
+            torch.device("cuda"),
+            marks=pytest.mark.skipif(not torch.cuda.is_available(), reason="CUDA is not available"),
+        ),
+    ],
+)
+def test_prefetch_to_device(device):
+    batches = [
+        {
+            "input_ids": torch.tensor([[i, i + 1]]),
+            "mask": torch.tensor([[1, 1]]),
+            "ids": [i],
+            "offsets": torch.zeros(1, 2),
+        }
+        for i in range(3)
+    ]
+    offsets = [batch["offsets"] for batch in batches]
+
+    prefetched = list(prefetch_to_device(iter(batches), device=device, keys=["input_ids", "mask"]))
+
+    assert len(prefetched) == 3
+    for i, batch in enumerate(prefetched):
+        assert batch["input_ids"].device.type == device.type
+        assert batch["mask"].device.type == device.type
+        assert batch["input_ids"].tolist() == [[i, i + 1]]
+        assert batch["mask"].tolist() == [[1, 1]]
+        # The other values are left as is
+        assert batch["ids"] == [i]
+        assert batch["offsets"] is offsets[i]
+
+
+def test_prefetch_to_device_without_batches():
+    assert list(prefetch_to_device(iter([]), device=torch.device("cpu"), keys=["input_ids"])) == []